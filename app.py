@@ -1,12 +1,15 @@
 # SPDX-License-Identifier: GPL-3.0-only
-from flask import Flask, render_template, request, jsonify, send_file, abort
+from flask import Flask, render_template, request, jsonify, send_file, abort, Response
+import atexit
 import threading
 import os
-import json
 import time
-import asyncio
+import functools
+import hashlib
+import math
 import sys
-from typing import List, Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Tuple
 
 # make repo importable: ensure project root and cwd are on sys.path
 proj_root = os.path.abspath(os.path.dirname(__file__))
@@ -17,13 +20,26 @@ cwd = os.path.abspath(os.getcwd())
 if cwd not in sys.path:
     sys.path.insert(0, cwd)
 
+import httpx
 from ollama import Client
 from ollama_etch_tester import test_model
 import db
+import jsonio
 import run_manager
 
+# paths resolved once at import time
+_LATEST_PATH = os.path.join(proj_root, 'latest_results.json')
+_TEMPLATES = os.path.join(proj_root, 'templates')
+_STATIC = os.path.join(proj_root, 'static')
+_VERSION_PATH = os.path.join(proj_root, 'VERSION')
+try:
+    with open(_VERSION_PATH, 'r', encoding='utf-8') as vf:
+        _VERSION = vf.read().strip()
+except Exception:
+    _VERSION = 'unknown'
+
 # initialize DB
-DB_FILE = os.path.join(os.path.dirname(__file__), "data.db")
+DB_FILE = os.path.join(proj_root, "data.db")
 try:
     db.init_db(DB_FILE)
 except Exception:
@@ -32,13 +48,52 @@ except Exception:
 # default host shown in the UI
 DEFAULT_HOST = os.environ.get('OLLAMA_DEFAULT_HOST', 'http://localhost:11434')
 
+# ask all smartness questions in one prompt instead of one call each
+BATCH_SMARTNESS = os.environ.get('OLLAMAIQ_BATCH_SMARTNESS', '').lower() in ('1', 'true', 'yes')
+# stream smartness answers and stop reading once they are known to pass
+EARLY_EXIT = os.environ.get('OLLAMAIQ_EARLY_EXIT', '').lower() in ('1', 'true', 'yes')
+
+# background runs share a bounded pool; extra runs wait as 'pending'
+_run_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('OLLAMAIQ_CONCURRENT_RUNS', '2')), thread_name_prefix='ollamaiq-run')
+atexit.register(functools.partial(_run_executor.shutdown, cancel_futures=True))
+
+# reuse responses to identical prompts tested within this many seconds
+# (0 disables the cache; cached prompts report their original latency)
+PROMPT_CACHE_TTL = float(os.environ.get('OLLAMAIQ_PROMPT_CACHE_TTL', '0') or 0)
+
+# saved hosts are read on every page render but change rarely; keep them in
+# memory and drop the copy whenever a host is added or deleted
+_hosts_cache: Optional[List[str]] = None
+_hosts_cache_lock = threading.Lock()
+
+
 def get_saved_hosts():
-    s = _unique(db.list_hosts())
-    if DEFAULT_HOST not in s:
-        s.append(DEFAULT_HOST)
-    return s
+    global _hosts_cache
+    with _hosts_cache_lock:
+        if _hosts_cache is None:
+            s = _unique(db.list_hosts())
+            if DEFAULT_HOST not in s:
+                s.append(DEFAULT_HOST)
+            _hosts_cache = s
+        return list(_hosts_cache)
+
+
+def _invalidate_hosts_cache():
+    global _hosts_cache
+    with _hosts_cache_lock:
+        _hosts_cache = None
+
+
+def _add_host(url: str) -> None:
+    db.add_host(url)
+    _invalidate_hosts_cache()
+
+
+def _delete_host(url: str) -> None:
+    db.delete_host(url)
+    _invalidate_hosts_cache()
 
-app = Flask(__name__, template_folder=os.path.join(os.path.dirname(__file__), 'templates'), static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+app = Flask(__name__, template_folder=_TEMPLATES, static_folder=_STATIC)
 
 import datetime
 
@@ -48,28 +103,83 @@ def datetimeformat(ts):
 
 
 def _unique(seq):
-    seen = set()
-    out = []
-    for x in seq:
-        if x not in seen:
-            seen.add(x)
-            out.append(x)
-    return out
+    return list(dict.fromkeys(seq))
+
+
+def _json_response(obj) -> Response:
+    return Response(jsonio.dumps(obj), mimetype='application/json')
+
+
+def _log(run_id: str, events: List[Tuple[float, str]], msg: str) -> None:
+    # live progress goes to run_manager; events is persisted with the run
+    run_manager.append_message_sync(run_id, msg)
+    events.append((time.time(), msg))
+
+
+@functools.lru_cache(maxsize=256)
+def _get_run_cached(run_id: int) -> Dict[str, Any]:
+    # saved runs never change, so their decoded summaries can be shared;
+    # misses raise so that unknown ids are not cached as None
+    data = db.get_run(run_id)
+    if not data:
+        raise LookupError(run_id)
+    return data
+
+
+def _get_saved_run(run_id: int) -> Optional[Dict[str, Any]]:
+    try:
+        return _get_run_cached(run_id)
+    except LookupError:
+        return None
+
+
+class _PromptCache:
+    """Exact-match prompt cache for test_model backed by the prompt_cache table."""
+
+    def __init__(self, host: str, ttl: float):
+        self.host = host
+        self.ttl = ttl
 
-# helper to call async run_manager functions from sync code
-def arun(coro):
-    return asyncio.run(coro)
+    @staticmethod
+    def _key(prompt: str) -> bytes:
+        return hashlib.sha256(prompt.encode('utf-8')).digest()
+
+    def get(self, model: str, prompt: str) -> Optional[Tuple[float, str]]:
+        return db.get_cached_response(self.host, model, self._key(prompt), self.ttl)
+
+    def put(self, model: str, prompt: str, latency: float, text: str) -> None:
+        db.put_cached_response(self.host, model, self._key(prompt), latency, text)
+
+
+# clients keep their HTTP connection pool alive across requests and runs
+_client_cache: Dict[Tuple[str, Optional[str]], Client] = {}
+_client_cache_lock = threading.Lock()
+_CLIENT_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100)
 
 
 def _get_client(host: str, api_key: Optional[str]) -> Client:
-    headers = {}
-    if api_key:
-        headers["Authorization"] = f"Bearer {api_key}"
-    return Client(host=host, headers=headers) if headers or host else Client()
+    key = (host, api_key)
+    with _client_cache_lock:
+        client = _client_cache.get(key)
+        if client is None:
+            headers = {}
+            if api_key:
+                headers["Authorization"] = f"Bearer {api_key}"
+            client = Client(host=host, headers=headers, limits=_CLIENT_LIMITS) if headers or host else Client(limits=_CLIENT_LIMITS)
+            _client_cache[key] = client
+        return client
 
 
 def _normalize_models(models_raw) -> List[str]:
-    # normalize and dedupe across possible Ollama response shapes
+    # fast path: the shape client.list() actually returns, either a plain
+    # {"models": [{"name": ..., "model": ...}]} dict or a ListResponse object
+    if isinstance(models_raw, dict) and isinstance(models_raw.get('models'), list):
+        return _unique(nm for nm in (m.get('name') or m.get('model') for m in models_raw['models'] if isinstance(m, dict)) if nm)
+    models_list = getattr(models_raw, 'models', None)
+    if isinstance(models_list, list):
+        return _unique(nm for nm in (getattr(m, 'model', None) for m in models_list) if nm)
+
+    # normalize and dedupe across other possible Ollama response shapes
     names: List[str] = []
     try:
         for m in list(models_raw):
@@ -82,33 +192,35 @@ def _normalize_models(models_raw) -> List[str]:
                 for e in m[1]:
                     if hasattr(e, 'model'):
                         nm = getattr(e, 'model')
-                        if nm and nm not in names:
+                        if nm:
                             names.append(nm)
                 continue
             elif hasattr(m, 'model'):
                 name = getattr(m, 'model')
             else:
                 name = str(m)
-            if name and name not in names:
+            if name:
                 names.append(name)
     except Exception:
         names = [str(models_raw)]
-    return names
+    return _unique(names)
 
 
-def _run_tests_sync(host: str, api_key: Optional[str], repeat: int, models: Optional[List[str]], run_id: Optional[str] = None) -> Dict[str, Any]:
+def _run_tests_sync(host: str, api_key: Optional[str], repeat: int, models: Optional[List[str]], run_id: Optional[str] = None, events: Optional[List[Tuple[float, str]]] = None) -> Dict[str, Any]:
+    if events is None:
+        events = []
     client = _get_client(host, api_key)
 
     try:
         models_raw = client.list()
     except Exception as e:
         if run_id:
-            arun(run_manager.set_error(run_id, str(e)))
+            run_manager.set_error_sync(run_id, str(e))
         return {"host": host, "models_tested": [], "available_models": [], "timestamp": time.time(), "error": str(e)}
 
     # save host
     try:
-        db.add_host(host)
+        _add_host(host)
     except Exception:
         pass
 
@@ -123,21 +235,22 @@ def _run_tests_sync(host: str, api_key: Optional[str], repeat: int, models: Opti
     if not test_models:
         return summary
 
+    cache = _PromptCache(host, PROMPT_CACHE_TTL) if PROMPT_CACHE_TTL > 0 else None
     total = len(test_models)
     for idx, mn in enumerate(test_models, start=1):
         if run_id:
-            arun(run_manager.append_message(run_id, f"Testing model: {mn} ({idx}/{total})..."))
-            arun(run_manager.set_progress(run_id, int(((idx - 1) / total) * 100)))
+            _log(run_id, events, f"Testing model: {mn} ({idx}/{total})...")
+            run_manager.set_progress_sync(run_id, int(((idx - 1) / total) * 100))
 
-        res = test_model(client, mn, repeat)
+        res = test_model(client, mn, repeat, cache=cache, batch_smartness=BATCH_SMARTNESS, early_exit=EARLY_EXIT)
         summary['models_tested'].append(res)
 
         if run_id:
-            arun(run_manager.append_message(run_id, f"Completed {mn}: smartness={res.get('smartness_score')}% mean={res.get('latency_stats', {}).get('mean')}s"))
-            arun(run_manager.set_progress(run_id, int((idx / total) * 95)))
+            _log(run_id, events, f"Completed {mn}: smartness={res.get('smartness_score')}% mean={res.get('latency_stats', {}).get('mean')}s")
+            run_manager.set_progress_sync(run_id, int((idx / total) * 95))
 
     if run_id:
-        arun(run_manager.set_progress(run_id, 95))
+        run_manager.set_progress_sync(run_id, 95)
 
     return summary
 
@@ -153,10 +266,10 @@ def fetch():
     chosen = request.form.get('host_new') or request.form.get('host') or ''
     api_key = request.form.get('api_key')
     if not chosen:
-        return render_template('index.html', request=request, results={'host':'','models_tested':[],'available_models':[],'timestamp':time.time(),'error':'No host provided'}, rows=[], fastest=None, best_code=None, best_smart=None, saved_hosts=db.list_hosts())
+        return render_template('index.html', request=request, results={'host':'','models_tested':[],'available_models':[],'timestamp':time.time(),'error':'No host provided'}, rows=[], fastest=None, best_code=None, best_smart=None, saved_hosts=get_saved_hosts())
 
     try:
-        db.add_host(chosen)
+        _add_host(chosen)
     except Exception:
         pass
 
@@ -164,12 +277,77 @@ def fetch():
     try:
         models_raw = client.list()
     except Exception as e:
-        return render_template('index.html', request=request, results={'host':chosen,'models_tested':[],'available_models':[],'timestamp':time.time(),'error':str(e)}, rows=[], fastest=None, best_code=None, best_smart=None, saved_hosts=db.list_hosts())
+        return render_template('index.html', request=request, results={'host':chosen,'models_tested':[],'available_models':[],'timestamp':time.time(),'error':str(e)}, rows=[], fastest=None, best_code=None, best_smart=None, saved_hosts=get_saved_hosts())
 
     results = {'host': chosen, 'models_tested': [], 'available_models': _normalize_models(models_raw), 'timestamp': time.time()}
     return render_template('index.html', results=results, rows=[], fastest=None, best_code=None, best_smart=None, saved_hosts=get_saved_hosts())
 
 
+def _top_summary(ms: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # single pass over the tested models; ties keep the earliest model
+    fastest = best_code = best_smart = None
+    best_mean = math.inf
+    best_c = best_s = -math.inf
+    for m in ms:
+        mean = (m.get('latency_stats') or {}).get('mean') or math.inf
+        if fastest is None or mean < best_mean:
+            fastest, best_mean = m, mean
+        code = m.get('code_score')
+        code = (float(code) or -1) if code is not None else -1
+        if code > best_c:
+            best_code, best_c = m, code
+        smart = m.get('smartness_score')
+        smart = (float(smart) or -1) if smart is not None else -1
+        if smart > best_s:
+            best_smart, best_s = m, smart
+
+    top: Dict[str, Any] = {}
+    if fastest is not None:
+        top['fastest'] = {'model': fastest.get('model'), 'mean': (fastest.get('latency_stats') or {}).get('mean')}
+    if best_code is not None and best_code.get('code_score') is not None:
+        top['best_code'] = {'model': best_code.get('model'), 'code_score': best_code.get('code_score')}
+    if best_smart is not None and best_smart.get('smartness_score') is not None:
+        top['best_smart'] = {'model': best_smart.get('model'), 'smartness_score': best_smart.get('smartness_score')}
+    return top
+
+
+def _run_bg(run_id: str, host: str, api_key: Optional[str], repeat: int, models: Optional[List[str]]) -> None:
+    events: List[Tuple[float, str]] = []
+    run_manager.set_running_sync(run_id)
+    _log(run_id, events, 'Starting run...')
+    try:
+        summary = _run_tests_sync(host, api_key, repeat, models, run_id=run_id, events=events)
+
+        # compute top summary
+        try:
+            summary['top_summary'] = _top_summary(summary.get('models_tested', []) or [])
+        except Exception:
+            summary['top_summary'] = {}
+
+        _log(run_id, events, 'Tests complete; saving result')
+        run_manager.set_result_sync(run_id, summary)
+        try:
+            p = _LATEST_PATH
+            with open(p, 'wb') as f:
+                f.write(jsonio.dumps(summary, indent=True))
+            _log(run_id, events, f"Saved results to {p}")
+        except Exception as e2:
+            _log(run_id, events, f"Failed to save results: {e2}")
+
+        try:
+            run_db_id = db.save_run_with_events(summary, events)
+            _get_run_cached.cache_clear()
+            summary['_db_id'] = run_db_id
+            run_manager.append_message_sync(run_id, f"Saved run into DB (id={run_db_id})")
+            run_manager.set_result_sync(run_id, summary)
+        except Exception as e3:
+            run_manager.append_message_sync(run_id, f"Failed to persist run to DB: {e3}")
+
+        run_manager.set_progress_sync(run_id, 100)
+    except Exception as e:
+        run_manager.set_error_sync(run_id, str(e))
+
+
 @app.route('/start_run', methods=['POST'])
 def start_run():
     payload = request.get_json() or {}
@@ -182,83 +360,58 @@ def start_run():
 
     run_id = run_manager.create_run({'host': host, 'models': models or [], 'repeat': repeat})
 
-    def bg():
-        arun(run_manager.set_running(run_id))
-        arun(run_manager.append_message(run_id, 'Starting run...'))
-        try:
-            summary = _run_tests_sync(host, api_key, repeat, models, run_id=run_id)
-
-            # compute top summary
-            try:
-                ms = summary.get('models_tested', []) or []
-                top = {}
-                if ms:
-                    try:
-                        fastest = min(ms, key=lambda m: (m.get('latency_stats') or {}).get('mean') or float('inf'))
-                        top['fastest'] = {'model': fastest.get('model'), 'mean': (fastest.get('latency_stats') or {}).get('mean')}
-                    except Exception:
-                        pass
-                    try:
-                        best_code = max(ms, key=lambda m: (m.get('code_score') is not None) and float(m.get('code_score')) or -1)
-                        if best_code and best_code.get('code_score') is not None:
-                            top['best_code'] = {'model': best_code.get('model'), 'code_score': best_code.get('code_score')}
-                    except Exception:
-                        pass
-                    try:
-                        best_smart = max(ms, key=lambda m: (m.get('smartness_score') is not None) and float(m.get('smartness_score')) or -1)
-                        if best_smart and best_smart.get('smartness_score') is not None:
-                            top['best_smart'] = {'model': best_smart.get('model'), 'smartness_score': best_smart.get('smartness_score')}
-                    except Exception:
-                        pass
-                summary['top_summary'] = top
-            except Exception:
-                summary['top_summary'] = {}
-
-            arun(run_manager.append_message(run_id, 'Tests complete; saving result'))
-            arun(run_manager.set_result(run_id, summary))
-            try:
-                p = os.path.join(os.path.dirname(__file__), 'latest_results.json')
-                with open(p, 'w', encoding='utf-8') as f:
-                    json.dump(summary, f, indent=2)
-                arun(run_manager.append_message(run_id, f"Saved results to {p}"))
-            except Exception as e2:
-                arun(run_manager.append_message(run_id, f"Failed to save results: {e2}"))
-
-            try:
-                run_db_id = db.save_run(summary)
-                arun(run_manager.append_message(run_id, f"Saved run into DB (id={run_db_id})"))
-                summary['_db_id'] = run_db_id
-                arun(run_manager.set_result(run_id, summary))
-            except Exception as e3:
-                arun(run_manager.append_message(run_id, f"Failed to persist run to DB: {e3}"))
-
-            arun(run_manager.set_progress(run_id, 100))
-        except Exception as e:
-            arun(run_manager.set_error(run_id, str(e)))
-
-    thread = threading.Thread(target=bg, daemon=True)
-    thread.start()
+    _run_executor.submit(_run_bg, run_id, host, api_key, repeat, models)
 
     return jsonify({'run_id': run_id})
 
 
 @app.route('/run_status/<run_id>')
 def run_status(run_id):
-    r = arun(run_manager.get_run(run_id))
+    r = run_manager.get_run_sync(run_id)
     if not r:
         return jsonify({'error':'not found'})
-    return jsonify(r)
+    return _json_response(r)
+
+
+# each open stream occupies a server thread, so streams end after this many
+# seconds and the browser reconnects; requests queued behind them get a
+# thread in between instead of waiting for the whole run
+_SSE_MAX_AGE = 30
+_SSE_KEEPALIVE = 15
+
+
+def _event_stream(run_id: str):
+    # push a status snapshot whenever the run changes; comment lines keep
+    # idle connections alive and let us notice clients that went away
+    version = 0
+    deadline = time.monotonic() + _SSE_MAX_AGE
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            yield 'event: reconnect\ndata: {}\n\n'
+            return
+        changed = run_manager.wait_for_change_sync(run_id, version, timeout=min(_SSE_KEEPALIVE, remaining))
+        if changed is None:
+            yield f"data: {jsonio.dumps({'error': 'not found'}).decode('utf-8')}\n\n"
+            return
+        new_version, snap = changed
+        if new_version == version:
+            yield ': keep-alive\n\n'
+            continue
+        version = new_version
+        yield f"data: {jsonio.dumps(snap).decode('utf-8')}\n\n"
+        if snap['status'] in ('done', 'error'):
+            return
+
+
+@app.route('/run_events/<run_id>')
+def run_events(run_id):
+    return Response(_event_stream(run_id), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/about')
 def about():
-    version = None
-    try:
-        with open(os.path.join(os.path.dirname(__file__), 'VERSION'), 'r', encoding='utf-8') as vf:
-            version = vf.read().strip()
-    except Exception:
-        version = 'unknown'
-    return render_template('about.html', version=version)
+    return render_template('about.html', version=_VERSION)
 
 
 @app.route('/delete_host', methods=['POST'])
@@ -268,7 +421,7 @@ def delete_host():
     if not host:
         return jsonify({'error': 'No host provided'})
     try:
-        db.delete_host(host)
+        _delete_host(host)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)})
@@ -286,24 +439,70 @@ def history():
 
 @app.route('/download/<int:run_id>')
 def download_run(run_id):
+    # serve the stored JSON as-is instead of decoding and re-encoding it;
+    # clients that accept zstd get the stored compressed bytes untouched
     try:
-        data = db.get_run(run_id)
+        if request.accept_encodings.quality('zstd') > 0:
+            blob = db.get_run_compressed(run_id)
+            if blob:
+                resp = Response(blob, mimetype='application/json')
+                resp.headers['Content-Encoding'] = 'zstd'
+                resp.vary.add('Accept-Encoding')
+                return resp
+        raw = db.get_run_raw(run_id)
     except Exception as e:
         return jsonify({'error': f'Database error: {e}'}), 500
-    if not data:
+    if not raw:
         abort(404)
-    return jsonify(data)
+    resp = Response(raw, mimetype='application/json')
+    resp.vary.add('Accept-Encoding')
+    return resp
 
 
 @app.route('/view/<int:run_id>')
 def view_run(run_id):
     try:
-        data = db.get_run(run_id)
+        data = _get_saved_run(run_id)
+        run_log = db.list_run_messages(run_id) if data else []
     except Exception as e:
         return render_template('index.html', results={'error': f'Database error: {e}'}, rows=[], fastest=None, best_code=None, best_smart=None, saved_hosts=get_saved_hosts())
     if not data:
         return render_template('history.html', runs=db.list_runs())
-    return render_template('index.html', results=data, rows=[], fastest=None, best_code=None, best_smart=None, saved_hosts=get_saved_hosts())
+    return render_template('index.html', results=data, rows=[], fastest=None, best_code=None, best_smart=None, saved_hosts=get_saved_hosts(), run_log=run_log)
+
+
+def _serve(host: str, port: int) -> None:
+    """Serve the app with gunicorn (one worker, threaded), falling back to Werkzeug."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        app.run(host=host, port=port, threaded=True)
+        return
+
+    def _post_fork(server, worker):
+        # SQLite connections must not be carried across fork(); the worker
+        # opens its own
+        try:
+            db.init_db(DB_FILE)
+        except Exception:
+            pass
+
+    class _Server(BaseApplication):
+        def load_config(self):
+            # one worker: run progress lives in this process' memory
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', 1)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', int(os.environ.get('OLLAMAIQ_THREADS', '8')))
+            self.cfg.set('post_fork', _post_fork)
+
+        def load(self):
+            return app
+
+    # the master only forks; drop the connections opened at import so none
+    # are inherited by the worker
+    db.close_db()
+    _Server().run()
 
 
 if __name__ == '__main__':
@@ -311,5 +510,8 @@ if __name__ == '__main__':
     debug_env = os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes') or os.environ.get('FLASK_ENV') == 'development'
     host = os.environ.get('FLASK_RUN_HOST', '127.0.0.1')
     port = int(os.environ.get('FLASK_RUN_PORT', '9912'))
-    # When debugging, enable the reloader for convenience
-    app.run(host=host, port=port, debug=debug_env, use_reloader=debug_env)
+    if debug_env:
+        # When debugging, use the Werkzeug server with the reloader for convenience
+        app.run(host=host, port=port, debug=True, use_reloader=True)
+    else:
+        _serve(host, port)
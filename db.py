@@ -1,133 +1,313 @@
 # SPDX-License-Identifier: GPL-3.0-only
+import os
+import queue
 import sqlite3
+import threading
 import time
-import json
-from typing import List
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from jsonio import dumps, loads
+
+try:
+    import zstandard
+except ImportError:  # summaries are stored as plain JSON text instead
+    zstandard = None
+
+ZSTD_LEVEL = 3
 
 DB_PATH = None
 
+# one shared writer connection (serialized by a lock) plus a pool of readers,
+# all opened once in init_db and reused for the lifetime of the process
+_writer: Optional[sqlite3.Connection] = None
+_writer_lock = threading.Lock()
+_reader_pool: Optional["queue.Queue[sqlite3.Connection]"] = None
 
-def init_db(db_path: str):
+# applied to every connection right after it is opened
+_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA busy_timeout=5000;
+PRAGMA synchronous=NORMAL;
+PRAGMA cache_size=-20000;
+PRAGMA temp_store=memory;
+PRAGMA foreign_keys=ON;
+"""
+
+
+def _encode_summary(summary: dict) -> Tuple[str, Optional[bytes]]:
+    """Return (summary_json, summary_blob) column values for a run."""
+    payload = dumps(summary)
+    if zstandard is None:
+        return payload.decode('utf-8'), None
+    return '', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload)
+
+
+def _decode_blob(blob: bytes) -> bytes:
+    if zstandard is None:
+        # saved while zstandard was installed; the JSON text column is empty
+        raise RuntimeError('this run is stored zstd-compressed; install the zstandard package to read it')
+    return zstandard.ZstdDecompressor().decompress(blob)
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    conn.executescript(_PRAGMAS)
+    return conn
+
+
+def _close_all() -> None:
+    global _writer, _reader_pool
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+    if _reader_pool is not None:
+        while True:
+            try:
+                _reader_pool.get_nowait().close()
+            except queue.Empty:
+                break
+        _reader_pool = None
+
+
+def close_db() -> None:
+    """Close all connections; init_db must be called again before use."""
     global DB_PATH
-    DB_PATH = db_path
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS hosts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT UNIQUE NOT NULL,
-            added_at REAL NOT NULL
+    with _writer_lock:
+        _close_all()
+        DB_PATH = None
+
+
+@contextmanager
+def _write() -> Iterator[sqlite3.Connection]:
+    if _writer is None:
+        raise RuntimeError('database not initialized')
+    with _writer_lock:
+        # take the write lock up front so concurrent writers wait on
+        # busy_timeout instead of failing mid-transaction with SQLITE_BUSY
+        _writer.execute("BEGIN IMMEDIATE")
+        try:
+            yield _writer
+        except BaseException:
+            _writer.execute("ROLLBACK")
+            raise
+        _writer.execute("COMMIT")
+
+
+@contextmanager
+def _read() -> Iterator[sqlite3.Connection]:
+    pool = _reader_pool
+    if pool is None:
+        raise RuntimeError('database not initialized')
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        # init_db/close_db may have replaced the pool meanwhile; its
+        # connections are gone, so don't hand this one back to anybody
+        if _reader_pool is pool:
+            pool.put(conn)
+        else:
+            conn.close()
+
+
+def init_db(db_path: str):
+    global DB_PATH, _writer, _reader_pool
+    with _writer_lock:
+        _close_all()
+        DB_PATH = None
+        writer = _connect(db_path)
+        writer.execute(
+            """
+            CREATE TABLE IF NOT EXISTS hosts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                added_at REAL NOT NULL
+            )
+            """
+        )
+        writer.execute(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                host TEXT,
+                summary_json TEXT NOT NULL,
+                summary_blob BLOB
+            )
+            """
         )
-        """
-    )
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS runs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            created_at REAL NOT NULL,
-            host TEXT,
-            summary_json TEXT NOT NULL
+        # databases created before summaries were compressed lack the column
+        columns = [r[1] for r in writer.execute("PRAGMA table_info(runs)")]
+        if 'summary_blob' not in columns:
+            writer.execute("ALTER TABLE runs ADD COLUMN summary_blob BLOB")
+        writer.execute("CREATE INDEX IF NOT EXISTS idx_hosts_added ON hosts(added_at DESC)")
+        writer.execute("CREATE INDEX IF NOT EXISTS idx_runs_created ON runs(created_at DESC)")
+        writer.execute(
+            """
+            CREATE TABLE IF NOT EXISTS run_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+                ts REAL NOT NULL,
+                message TEXT NOT NULL
+            )
+            """
         )
-        """
-    )
-    conn.commit()
-    conn.close()
+        writer.execute(
+            """
+            CREATE TABLE IF NOT EXISTS prompt_cache (
+                host TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_hash BLOB NOT NULL,
+                latency REAL NOT NULL,
+                response TEXT NOT NULL,
+                ts REAL NOT NULL,
+                PRIMARY KEY (host, model, prompt_hash)
+            )
+            """
+        )
+        size = os.cpu_count() or 1
+        pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=size)
+        for _ in range(size):
+            pool.put(_connect(db_path))
+        _writer = writer
+        _reader_pool = pool
+        DB_PATH = db_path
 
 
 def add_host(url: str) -> None:
+    add_hosts((url,))
+
+
+def add_hosts(urls: Iterable[str]) -> None:
+    """Insert several hosts in one transaction (duplicates are ignored)."""
     if not DB_PATH:
         return
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        c.execute("INSERT OR IGNORE INTO hosts (url, added_at) VALUES (?, ?)", (url, time.time()))
-        conn.commit()
-    except sqlite3.OperationalError:
-        # Table doesn't exist yet - ignore
-        pass
-    finally:
-        conn.close()
+    now = time.time()
+    with _write() as conn:
+        try:
+            conn.executemany("INSERT OR IGNORE INTO hosts (url, added_at) VALUES (?, ?)", [(u, now) for u in urls])
+        except sqlite3.OperationalError:
+            # Table doesn't exist yet - ignore
+            pass
 
 
 def delete_host(url: str) -> None:
     if not DB_PATH:
         return
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        c.execute("DELETE FROM hosts WHERE url = ?", (url,))
-        conn.commit()
-    except sqlite3.OperationalError:
-        # Table doesn't exist yet - ignore
-        pass
-    finally:
-        conn.close()
+    with _write() as conn:
+        try:
+            conn.execute("DELETE FROM hosts WHERE url = ?", (url,))
+        except sqlite3.OperationalError:
+            # Table doesn't exist yet - ignore
+            pass
 
 
 def list_hosts() -> List[str]:
     if not DB_PATH:
         return []
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        c.execute("SELECT url FROM hosts ORDER BY added_at DESC")
-        rows = c.fetchall()
-        return [r[0] for r in rows]
-    except sqlite3.OperationalError:
-        # Table doesn't exist yet
-        return []
-    finally:
-        conn.close()
+    with _read() as conn:
+        try:
+            rows = conn.execute("SELECT url FROM hosts ORDER BY added_at DESC").fetchall()
+            return [r[0] for r in rows]
+        except sqlite3.OperationalError:
+            # Table doesn't exist yet
+            return []
 
 
 def save_run(summary: dict) -> int:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS runs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            created_at REAL NOT NULL,
-            host TEXT,
-            summary_json TEXT NOT NULL
-        )
-        """)
-        conn.commit()
-        c.execute("INSERT INTO runs (created_at, host, summary_json) VALUES (?, ?, ?)", (time.time(), summary.get('host'), json.dumps(summary)))
-        conn.commit()
-        return c.lastrowid
-    finally:
-        conn.close()
+    return save_run_with_events(summary, ())
+
+
+def save_run_with_events(summary: dict, messages: Iterable[Tuple[float, str]]) -> int:
+    """Insert a run and its (timestamp, message) log in a single transaction."""
+    with _write() as conn:
+        text, blob = _encode_summary(summary)
+        c = conn.execute("INSERT INTO runs (created_at, host, summary_json, summary_blob) VALUES (?, ?, ?, ?)", (time.time(), summary.get('host'), text, blob))
+        run_db_id = c.lastrowid
+        conn.executemany("INSERT INTO run_messages (run_id, ts, message) VALUES (?, ?, ?)", [(run_db_id, ts, msg) for ts, msg in messages])
+        return run_db_id
 
 
 def list_runs() -> List[dict]:
     if not DB_PATH:
         return []
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        c.execute("SELECT id, created_at, host FROM runs ORDER BY created_at DESC")
-        rows = c.fetchall()
-        return [{'id': r[0], 'created_at': r[1], 'host': r[2]} for r in rows]
-    except sqlite3.OperationalError:
-        # Table doesn't exist yet
+    with _read() as conn:
+        try:
+            rows = conn.execute("SELECT id, created_at, host FROM runs ORDER BY created_at DESC").fetchall()
+            return [{'id': r[0], 'created_at': r[1], 'host': r[2]} for r in rows]
+        except sqlite3.OperationalError:
+            # Table doesn't exist yet
+            return []
+
+
+def list_run_messages(run_id: int) -> List[dict]:
+    """Return the progress log saved with a run, oldest first."""
+    if not DB_PATH:
         return []
-    finally:
-        conn.close()
+    with _read() as conn:
+        try:
+            rows = conn.execute("SELECT ts, message FROM run_messages WHERE run_id = ? ORDER BY id", (run_id,)).fetchall()
+            return [{'ts': r[0], 'message': r[1]} for r in rows]
+        except sqlite3.OperationalError:
+            # Table doesn't exist yet
+            return []
 
 
-def get_run(run_id: int) -> dict:
+def _get_run_columns(run_id: int) -> Optional[Tuple[str, Optional[bytes]]]:
     if not DB_PATH:
         return None
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        c.execute("SELECT summary_json FROM runs WHERE id = ?", (run_id,))
-        row = c.fetchone()
-        return json.loads(row[0]) if row else None
-    except sqlite3.OperationalError:
-        # Table doesn't exist yet
+    with _read() as conn:
+        try:
+            return conn.execute("SELECT summary_json, summary_blob FROM runs WHERE id = ?", (run_id,)).fetchone()
+        except sqlite3.OperationalError:
+            # Table doesn't exist yet
+            return None
+
+
+def get_run_compressed(run_id: int) -> Optional[bytes]:
+    """Return the run's zstd-compressed summary JSON, or None if not stored compressed."""
+    row = _get_run_columns(run_id)
+    return row[1] if row else None
+
+
+def get_run_raw(run_id: int) -> Optional[bytes]:
+    """Return the stored summary JSON for a run without decoding it."""
+    row = _get_run_columns(run_id)
+    if not row:
         return None
-    finally:
-        conn.close()
+    text, blob = row
+    if blob is not None:
+        return _decode_blob(blob)
+    return text.encode('utf-8') if text else None
+
+
+def get_run(run_id: int) -> dict:
+    raw = get_run_raw(run_id)
+    return loads(raw) if raw else None
+
+
+def get_cached_response(host: str, model: str, prompt_hash: bytes, max_age: float) -> Optional[Tuple[float, str]]:
+    """Return (latency, response) cached within the last max_age seconds."""
+    if not DB_PATH:
+        return None
+    with _read() as conn:
+        try:
+            row = conn.execute(
+                "SELECT latency, response FROM prompt_cache WHERE host = ? AND model = ? AND prompt_hash = ? AND ts >= ?",
+                (host, model, prompt_hash, time.time() - max_age),
+            ).fetchone()
+            return (row[0], row[1]) if row else None
+        except sqlite3.OperationalError:
+            # Table doesn't exist yet
+            return None
+
+
+def put_cached_response(host: str, model: str, prompt_hash: bytes, latency: float, response: str) -> None:
+    if not DB_PATH:
+        return
+    with _write() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO prompt_cache (host, model, prompt_hash, latency, response, ts) VALUES (?, ?, ?, ?, ?, ?)",
+            (host, model, prompt_hash, latency, response, time.time()),
+        )
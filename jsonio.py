@@ -0,0 +1,31 @@
+# SPDX-License-Identifier: GPL-3.0-only
+"""JSON encoding shared by the app, the database layer and the tester.
+
+Uses orjson when it is installed and the stdlib json module otherwise.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+
+def dumps(obj, indent: bool = False) -> bytes:
+    """Encode ``obj`` as UTF-8 JSON.
+
+    Values that aren't JSON types, dataclass instances included, are
+    written as their ``str()``.
+    """
+    if orjson is not None:
+        try:
+            option = orjson.OPT_PASSTHROUGH_DATACLASS | (orjson.OPT_INDENT_2 if indent else 0)
+            return orjson.dumps(obj, default=str, option=option)
+        except TypeError:
+            # e.g. integers wider than 64 bits; let json handle those
+            pass
+    return json.dumps(obj, indent=2 if indent else None, default=str).encode('utf-8')
+
+
+def loads(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
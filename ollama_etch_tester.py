@@ -7,11 +7,31 @@ This module tests LLM models on:
 
 Results include detailed scoring with breakdowns for each category.
 """
+import ast
+import asyncio
+import functools
+import hashlib
+import inspect
+import math
+import os
+import queue
+import select
+import subprocess
+import sys
+import tempfile
 import time
-import statistics
 import re
-import json
-from typing import Any, Dict, List, Optional, Tuple
+import weakref
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import jsonio
+
+
+_TEXT_KEYS = ('response', 'text')
+_TEXT_ATTRS = ('text', 'response', 'content')
 
 
 def _get_response_text(resp) -> Optional[str]:
@@ -21,48 +41,201 @@ def _get_response_text(resp) -> Optional[str]:
     if isinstance(resp, str):
         return resp
     if isinstance(resp, dict):
-        return resp.get('message', {}).get('content') or resp.get('response') or resp.get('text') or str(resp)
+        # the usual chat shape, {"message": {"content": ...}}
+        try:
+            text = resp["message"]["content"]
+        except (KeyError, TypeError):
+            text = None
+        if text:
+            return text
+        for key in _TEXT_KEYS:
+            text = resp.get(key)
+            if text:
+                return text
+        return str(resp)
     # Object response
-    return (getattr(resp, 'text', None) or 
-            getattr(resp, 'response', None) or 
-            getattr(resp, 'content', None) or
-            (getattr(resp, 'message', {}).get('content') if hasattr(resp, 'message') else None) or
-            str(resp))
+    for name in _TEXT_ATTRS:
+        text = getattr(resp, name, None)
+        if text:
+            return text
+    if hasattr(resp, 'message'):
+        text = resp.message.get('content')
+        if text:
+            return text
+    return str(resp)
+
 
+def _default_concurrency() -> int:
+    """Concurrent prompts per model, from OLLAMA_NUM_PARALLEL.
 
-def _chat_with_model(client, model: str, prompt: str, timeout: int = 60) -> Tuple[float, Optional[str], Optional[str]]:
-    """Send a prompt to the model and return (latency, response_text, error)."""
-    start = time.time()
+    The server's real parallelism can't be queried, so without the variable
+    prompts go one at a time; anything more would queue on a server that
+    answers one at a time and that wait would count as latency.
+    """
     try:
-        resp = client.chat(model=model, messages=[{"role": "user", "content": prompt}])
-        text = _get_response_text(resp)
-        return time.time() - start, text, None
-    except Exception as e:
-        return time.time() - start, None, str(e)
+        return max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "1")))
+    except ValueError:
+        return 1
+
+
+def _chunk_text(chunk) -> str:
+    try:
+        return chunk["message"]["content"] or ''
+    except (KeyError, TypeError):
+        return ''
+
+
+def _stream_until(stream, stop: Callable[[str], bool]) -> str:
+    """Read a blocking chat stream until ``stop(text)`` holds, then close it."""
+    text = ''
+    try:
+        for chunk in stream:
+            text += _chunk_text(chunk)
+            if stop(text):
+                break
+    finally:
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+    return text
+
+
+async def _astream_until(client, model: str, messages: List[Dict[str, str]], stop: Callable[[str], bool]) -> str:
+    """Stream a chat reply until ``stop(text)`` holds and return the text so far.
+
+    Closing the stream early drops the connection, which makes Ollama stop
+    generating the rest of the answer.
+    """
+    if not inspect.iscoroutinefunction(client.chat):
+        return await asyncio.to_thread(lambda: _stream_until(client.chat(model=model, messages=messages, stream=True), stop))
+    stream = await client.chat(model=model, messages=messages, stream=True)
+    text = ''
+    try:
+        async for chunk in stream:
+            text += _chunk_text(chunk)
+            if stop(text):
+                break
+    finally:
+        aclose = getattr(stream, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+    return text
+
+
+async def _achat_with_model(client, model: str, prompt: str, timeout: int = 60, cache=None, sem: Optional[asyncio.Semaphore] = None, stop: Optional[Callable[[str], bool]] = None) -> Tuple[float, Optional[str], Optional[str]]:
+    """Send a prompt to the model and return (latency, response_text, error).
+
+    ``client`` may be an ``ollama.AsyncClient`` or a blocking ``ollama.Client``;
+    blocking calls run in a worker thread so prompts can still overlap.
+    ``sem`` bounds how many prompts are in flight; latency is measured from
+    the moment a slot is acquired. Time a prompt spends queued on the server
+    is still counted, so ``sem`` should not allow more prompts than the
+    server answers in parallel.
+
+    If a ``cache`` is given (an object with ``get(model, prompt)`` returning
+    ``(latency, text)`` or None, and ``put(model, prompt, latency, text)``),
+    a hit is returned with its originally measured latency and the model is
+    not called.
+
+    With ``stop`` the reply is streamed and cut off as soon as
+    ``stop(text_so_far)`` is true; the partial text is returned and is not
+    written to the cache.
+    """
+    if cache is not None:
+        try:
+            hit = cache.get(model, prompt)
+        except Exception:
+            hit = None
+        if hit is not None:
+            return hit[0], hit[1], None
+    if sem is None:
+        sem = asyncio.Semaphore(1)
+    messages = [{"role": "user", "content": prompt}]
+    async with sem:
+        start = time.time()
+        try:
+            if stop is not None:
+                text = await _astream_until(client, model, messages, stop)
+            elif inspect.iscoroutinefunction(client.chat):
+                text = _get_response_text(await client.chat(model=model, messages=messages))
+            else:
+                text = _get_response_text(await asyncio.to_thread(client.chat, model=model, messages=messages))
+        except Exception as e:
+            return time.time() - start, None, str(e)
+        latency = time.time() - start
+    # a reply cut short by ``stop`` is not the full answer to the prompt
+    if cache is not None and text and stop is None:
+        try:
+            cache.put(model, prompt, latency, text)
+        except Exception:
+            pass
+    return latency, text, None
+
+
+_CACHE_DIR = Path("~/.cache/ollama_iq").expanduser()
+
+
+class _DiskCache:
+    """Response cache for ``_achat_with_model`` stored as one JSON file per
+    (model, prompt) under ``_CACHE_DIR``, so it survives across processes."""
+
+    def __init__(self, path: Path = _CACHE_DIR):
+        self.path = path
+
+    def _file(self, model: str, prompt: str) -> Path:
+        return self.path / hashlib.sha256(f"{model}\x00{prompt}".encode('utf-8')).hexdigest()
+
+    def get(self, model: str, prompt: str) -> Optional[Tuple[float, str]]:
+        try:
+            entry = jsonio.loads(self._file(model, prompt).read_bytes())
+        except (OSError, ValueError):
+            return None
+        return entry["latency"], entry["response"]
+
+    def put(self, model: str, prompt: str, latency: float, text: str) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        target = self._file(model, prompt)
+        # write a private temp file, then rename it into place, so
+        # concurrent readers and writers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=f"{target.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(jsonio.dumps({"latency": latency, "response": text}))
+            os.replace(tmp, target)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
 
 
 # ==================== SMARTNESS TESTS ====================
 
+# Each test declares its answer key:
+#   "answer":      the response must contain this as a whole word
+#   "answer_any":  the lowercased response must contain one of these
+#   "answer_none": ...and none of these
 SMARTNESS_TESTS = [
     # Basic Math (10 points each, 30 total)
     {
         "name": "Basic Arithmetic",
         "prompt": "What is 17 + 28? Reply with just the number.",
-        "check": lambda r: bool(re.search(r'\b45\b', str(r))),
+        "answer": "45",
         "points": 10,
         "category": "math"
     },
     {
         "name": "Multiplication",
         "prompt": "What is 12 × 15? Reply with just the number.",
-        "check": lambda r: bool(re.search(r'\b180\b', str(r))),
+        "answer": "180",
         "points": 10,
         "category": "math"
     },
     {
         "name": "Word Problem",
         "prompt": "A store sells apples for $2 each. If you buy 7 apples and pay with a $20 bill, how much change do you get? Just the number.",
-        "check": lambda r: bool(re.search(r'\b6\b', str(r))),
+        "answer": "6",
         "points": 10,
         "category": "math"
     },
@@ -71,21 +244,22 @@ SMARTNESS_TESTS = [
     {
         "name": "Sequence Pattern",
         "prompt": "What comes next in this sequence: 2, 6, 12, 20, 30, ? Reply with just the number.",
-        "check": lambda r: bool(re.search(r'\b42\b', str(r))),
+        "answer": "42",
         "points": 15,
         "category": "logic"
     },
     {
         "name": "Logical Deduction",
         "prompt": "All roses are flowers. Some flowers fade quickly. Can we conclude that some roses fade quickly? Answer yes or no only.",
-        "check": lambda r: 'no' in str(r).lower(),
+        "answer_any": ["no"],
         "points": 15,
         "category": "logic"
     },
     {
         "name": "Comparison Logic",
         "prompt": "If A > B, B > C, and C > D, is A > D? Answer yes or no only.",
-        "check": lambda r: 'yes' in str(r).lower() and 'no' not in str(r).lower(),
+        "answer_any": ["yes"],
+        "answer_none": ["no"],
         "points": 15,
         "category": "logic"
     },
@@ -94,45 +268,138 @@ SMARTNESS_TESTS = [
     {
         "name": "Factual Knowledge",
         "prompt": "What is the capital of France? Reply with just the city name.",
-        "check": lambda r: 'paris' in str(r).lower(),
+        "answer_any": ["paris"],
         "points": 10,
         "category": "knowledge"
     },
     {
         "name": "Reading Comprehension",
         "prompt": "Read this: 'The blue car is faster than the red car. The green car is slower than the red car.' Which car is the slowest? Reply with just the color.",
-        "check": lambda r: 'green' in str(r).lower(),
+        "answer_any": ["green"],
         "points": 15,
         "category": "knowledge"
     }
 ]
 
 
-def _run_smartness_tests(client, model: str) -> Dict[str, Any]:
-    """Run all smartness tests and return detailed results."""
+# points available per category and overall, fixed by the suite above
+_SMARTNESS_CAT_TOTALS = Counter()
+for _t in SMARTNESS_TESTS:
+    _SMARTNESS_CAT_TOTALS[_t["category"]] += _t["points"]
+_SMARTNESS_TOTAL = sum(_SMARTNESS_CAT_TOTALS.values())
+
+# whole-word patterns for the "answer" keys, compiled once at import
+_ANSWER_RES = {t["answer"]: re.compile(rf'\b{re.escape(t["answer"])}\b') for t in SMARTNESS_TESTS if "answer" in t}
+
+
+def _evaluate(resp, spec: Dict[str, Any]) -> bool:
+    """Return whether ``resp`` satisfies the answer key of test ``spec``."""
+    text = str(resp)
+    if "answer" in spec and not _ANSWER_RES[spec["answer"]].search(text):
+        return False
+    if "answer_any" in spec or "answer_none" in spec:
+        text = text.lower()
+        if "answer_any" in spec and not any(a in text for a in spec["answer_any"]):
+            return False
+        if any(a in text for a in spec.get("answer_none", ())):
+            return False
+    return True
+
+
+def _early_stop(spec: Dict[str, Any]) -> Optional[Callable[[str], bool]]:
+    """Return a predicate that is true once a partial response passes ``spec``
+    whatever follows it, or None when that can't be known before the end.
+
+    A whole-word answer is only settled once something follows it ("45" may
+    still become "456"); "answer_none" keys can fail on any later text.
+    """
+    if "answer_none" in spec:
+        return None
+    pattern = _ANSWER_RES.get(spec.get("answer"))
+    answers = spec.get("answer_any")
+
+    def settled(text: str) -> bool:
+        if pattern is not None:
+            m = pattern.search(text)
+            if m is None or m.end() == len(text):
+                return False
+        if answers is not None:
+            lowered = text.lower()
+            return any(a in lowered for a in answers)
+        return True
+
+    return settled
+
+
+_BATCH_ANSWER_RE = re.compile(r'^\s*(\d+)[\.\)]', re.M)
+
+
+def _build_batch_prompt(tests: List[Dict[str, Any]]) -> str:
+    """Combine several test prompts into one numbered prompt."""
+    lines = [
+        f"Answer each of the following {len(tests)} questions. "
+        f"Reply with exactly one line per question, numbered 1 to {len(tests)}, "
+        "in the form 'N. answer'.",
+        "",
+    ]
+    for i, test in enumerate(tests, start=1):
+        lines.append(f"{i}. {test['prompt']}")
+    return "\n".join(lines)
+
+
+def _split_batch_response(text: str, count: int) -> Optional[List[str]]:
+    """Map a numbered batch answer back to its questions, or None if any is missing."""
+    marks = list(_BATCH_ANSWER_RE.finditer(text or ''))
+    answers: Dict[int, str] = {}
+    for m, nxt in zip(marks, marks[1:] + [None]):
+        end = nxt.start() if nxt else len(text)
+        answers.setdefault(int(m.group(1)), text[m.end():end].strip())
+    if any(i not in answers for i in range(1, count + 1)):
+        return None
+    return [answers[i] for i in range(1, count + 1)]
+
+
+async def _run_smartness_batch(client, model: str, cache=None, sem: Optional[asyncio.Semaphore] = None) -> Optional[List[Tuple[float, Optional[str], Optional[str]]]]:
+    """Ask every smartness question in a single chat call.
+
+    Each test is credited an equal share of the call's latency. Returns None
+    when the call fails or the answers can't be split, so the caller can fall
+    back to one call per test.
+    """
+    latency, response, error = await _achat_with_model(client, model, _build_batch_prompt(SMARTNESS_TESTS), cache=cache, sem=sem)
+    if error or not response:
+        return None
+    answers = _split_batch_response(response, len(SMARTNESS_TESTS))
+    if answers is None:
+        return None
+    share = latency / len(SMARTNESS_TESTS)
+    return [(share, answer, None) for answer in answers]
+
+
+async def _run_smartness_tests(client, model: str, cache=None, sem: Optional[asyncio.Semaphore] = None, batch: bool = False, early_exit: bool = False) -> Dict[str, Any]:
+    """Run all smartness tests and return detailed results.
+
+    With ``batch`` the questions are first asked in one combined prompt,
+    falling back to one prompt per test if the reply can't be parsed.
+    With ``early_exit`` each answer is streamed and cut off as soon as it
+    is known to pass (see ``_early_stop``).
+    """
     results = []
-    total_points = 0
     earned_points = 0
-    category_scores = {"math": {"earned": 0, "total": 0}, 
-                       "logic": {"earned": 0, "total": 0}, 
-                       "knowledge": {"earned": 0, "total": 0}}
+    category_earned = Counter()
     
-    for test in SMARTNESS_TESTS:
-        total_points += test["points"]
-        category_scores[test["category"]]["total"] += test["points"]
-        
-        latency, response, error = _chat_with_model(client, model, test["prompt"])
-        
+    responses = await _run_smartness_batch(client, model, cache=cache, sem=sem) if batch else None
+    if responses is None:
+        responses = await asyncio.gather(*(_achat_with_model(client, model, test["prompt"], cache=cache, sem=sem, stop=_early_stop(test) if early_exit else None) for test in SMARTNESS_TESTS))
+    
+    for test, (latency, response, error) in zip(SMARTNESS_TESTS, responses):
         passed = False
         if response and not error:
-            try:
-                passed = test["check"](response)
-            except Exception:
-                passed = False
+            passed = _evaluate(response, test)
         
         if passed:
             earned_points += test["points"]
-            category_scores[test["category"]]["earned"] += test["points"]
+            category_earned[test["category"]] += test["points"]
         
         results.append({
             "name": test["name"],
@@ -140,24 +407,19 @@ def _run_smartness_tests(client, model: str) -> Dict[str, Any]:
             "points": test["points"],
             "passed": passed,
             "latency_s": round(latency, 3),
-            "response": response[:500] if response else error,
+            "response": response if response else error,
             "error": error
         })
     
     # Calculate percentage scores
-    overall_score = round((earned_points / total_points) * 100, 1) if total_points > 0 else 0
+    overall_score = round((earned_points / _SMARTNESS_TOTAL) * 100, 1) if _SMARTNESS_TOTAL > 0 else 0
     
-    category_percentages = {}
-    for cat, scores in category_scores.items():
-        if scores["total"] > 0:
-            category_percentages[cat] = round((scores["earned"] / scores["total"]) * 100, 1)
-        else:
-            category_percentages[cat] = 0
+    category_percentages = {cat: round((category_earned[cat] / total) * 100, 1) for cat, total in _SMARTNESS_CAT_TOTALS.items()}
     
     return {
         "score": overall_score,
         "earned_points": earned_points,
-        "total_points": total_points,
+        "total_points": _SMARTNESS_TOTAL,
         "category_scores": category_percentages,
         "tests": results
     }
@@ -218,6 +480,16 @@ Return ONLY the function definition, no explanations.""",
     }
 ]
 
+_CODING_DIFF_TOTALS = Counter()
+for _t in CODING_TESTS:
+    _CODING_DIFF_TOTALS[_t["difficulty"]] += _t["points"]
+_CODING_TOTAL = sum(_CODING_DIFF_TOTALS.values())
+del _t
+
+
+_CODE_BLOCK_RE = re.compile(r"```(?:python)?\s*([\s\S]*?)```", re.I)
+_FUNC_RE = re.compile(r'def\s+\w+\s*\([^)]*\):.*(?:\n(?:[ \t]+.*|[ \t]*|(?:#|"|\'|return).*)(?=\n|$))*')
+
 
 def _extract_code(text: str) -> str:
     """Extract Python code from model response."""
@@ -225,43 +497,17 @@ def _extract_code(text: str) -> str:
         return ''
     
     # Extract from code blocks first
-    m = re.search(r"```(?:python)?\s*([\s\S]*?)```", text, flags=re.I)
+    m = _CODE_BLOCK_RE.search(text)
     if m:
         code = m.group(1).strip()
     else:
-        # Find function definition
-        func_match = re.search(r'def\s+\w+\s*\([^)]*\):', text)
-        if func_match:
-            code = text[func_match.start():]
-            # Get just the function
-            lines = code.split('\n')
-            result = []
-            in_function = False
-            base_indent = None
-            
-            for line in lines:
-                if not line.strip():
-                    if in_function:
-                        result.append(line)
-                    continue
-                    
-                current_indent = len(line) - len(line.lstrip())
-                
-                if line.strip().startswith('def '):
-                    if in_function and base_indent is not None and current_indent <= base_indent:
-                        break  # New function at same or lower indent
-                    in_function = True
-                    base_indent = current_indent
-                    result.append(line)
-                elif in_function:
-                    if current_indent <= base_indent and not line.strip().startswith(('#', '"', "'")):
-                        if not line.strip().startswith('return') and current_indent == base_indent:
-                            break
-                    result.append(line)
-            
-            code = '\n'.join(result).strip()
-        else:
+        # Find the first function definition and take it up to the first
+        # line back at its indent that isn't a comment, docstring or return;
+        # nested defs and the lines after them stay part of the function
+        func_match = _FUNC_RE.search(text)
+        if not func_match:
             return ''
+        code = func_match.group(0).strip()
     
     # Handle escape sequences
     try:
@@ -269,134 +515,250 @@ def _extract_code(text: str) -> str:
     except Exception:
         code = code.replace('\\n', '\n').replace('\\t', '\t')
     
+    if not m:
+        # a fallback extraction that doesn't parse picked up the wrong text
+        try:
+            ast.parse(code)
+        except (SyntaxError, ValueError):
+            return ''
+    
     return code
 
 
-def _run_code_safely(code_src: str, test_cases: List[Tuple], timeout: int = 5) -> Tuple[int, int, List[Dict]]:
-    """Execute code in sandbox and run test cases. Returns (passed, total, details)."""
-    import tempfile
-    import subprocess
-    import sys
-    import os
-    
-    if not code_src:
-        return 0, len(test_cases), [{'error': 'No code extracted from response'}]
-    
-    # Security check
-    dangerous = ['subprocess', 'socket', 'requests', 'eval(', 'exec(', '__import__', 'open(', 'os.system']
-    for pattern in dangerous:
-        if pattern in code_src:
-            return 0, len(test_cases), [{'error': f'Forbidden pattern: {pattern}'}]
-    
-    # Build test harness
-    harness = f'''# -*- coding: utf-8 -*-
-import json
-import sys
+_SANDBOX_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_worker.py')
 
-{code_src}
 
-def _run():
-    tests = {repr(test_cases)}
-    results = []
-    passed = 0
-    
-    # Find the solve function
-    fn = None
-    for name in ('solve', 'solution', 'main'):
-        if name in globals() and callable(globals()[name]):
-            fn = globals()[name]
-            break
-    
-    if not fn:
-        for v in list(globals().values()):
-            if callable(v) and not v.__name__.startswith('_'):
-                fn = v
-                break
-    
-    if not fn:
-        print(json.dumps({{"error": "No function found"}}))
-        return
-    
-    for inp, expected in tests:
-        try:
-            # Handle both single arg and tuple args
-            if isinstance(inp, (list, str, int)):
-                result = fn(inp)
-            else:
-                result = fn(*inp)
-            
-            # Flexible comparison for strings
-            ok = result == expected
-            if not ok and isinstance(expected, str) and isinstance(result, str):
-                ok = result.strip() == expected.strip()
-            
-            if ok:
-                passed += 1
-            results.append({{"input": repr(inp), "expected": expected, "got": result, "passed": ok}})
-        except Exception as e:
-            results.append({{"input": repr(inp), "expected": expected, "error": str(e), "passed": False}})
-    
-    print(json.dumps({{"passed": passed, "total": len(tests), "results": results}}))
+class _SandboxWorker:
+    """A long-lived ``sandbox_worker.py`` process that runs one job per call.
 
-if __name__ == "__main__":
-    _run()
-'''
-    
-    tf = None
-    try:
-        tf = tempfile.NamedTemporaryFile('w', delete=False, suffix='.py', encoding='utf-8')
-        tf.write(harness)
-        tf.flush()
-        tf_name = tf.name
-        tf.close()
-        
+    Interpreter startup is paid once instead of once per test. A job that
+    exceeds its timeout gets the process killed, and one that imports
+    modules makes the worker exit (see ``sandbox_worker``); either way the
+    next job respawns it.
+    Where pipes can't be waited on with ``select`` (Windows), every job runs
+    in a fresh one-shot worker instead.
+    """
+
+    persistent = os.name != 'nt'
+
+    def __init__(self):
+        self.proc = None
+
+    def _spawn(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-u', _SANDBOX_WORKER],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+        )
+
+    def run(self, code_src: str, test_cases: List[Tuple], timeout: float) -> Dict[str, Any]:
+        """Run one job and return the worker's decoded result.
+
+        Raises ``subprocess.TimeoutExpired`` on timeout and ``RuntimeError``
+        if the worker dies or answers with something other than JSON.
+        """
+        line = jsonio.dumps({"code": code_src, "tests": repr(test_cases)}).decode('utf-8') + '\n'
+        if not self.persistent:
+            return self._run_once(line, timeout)
+
+        if self.proc is None or self.proc.poll() is not None:
+            self._spawn()
         try:
-            result = subprocess.run(
-                [sys.executable, tf_name],
-                capture_output=True,
-                text=True,
-                timeout=timeout
-            )
-        except subprocess.TimeoutExpired:
-            return 0, len(test_cases), [{'error': f'Execution timeout ({timeout}s)'}]
-        
-        stdout = result.stdout.strip()
-        stderr = result.stderr.strip()
-        
-        if not stdout:
-            return 0, len(test_cases), [{'error': f'No output. Stderr: {stderr[:200]}'}]
-        
+            self.proc.stdin.write(line)
+            self.proc.stdin.flush()
+            ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+            out = self.proc.stdout.readline() if ready else None
+        except OSError as e:
+            self.close()
+            raise RuntimeError(f'Sandbox worker failed: {e}')
+        if out is None:
+            self.close()
+            raise subprocess.TimeoutExpired(_SANDBOX_WORKER, timeout)
+        if not out:
+            self.close()
+            raise RuntimeError('Sandbox worker exited unexpectedly')
+        data = self._decode(out)
+        # the job may have changed imported modules; the worker exits after
+        # such a job and the next one respawns it
+        if data.pop('recycle', False):
+            self.close()
+        return data
+
+    @staticmethod
+    def _run_once(line: str, timeout: float) -> Dict[str, Any]:
+        result = subprocess.run(
+            [sys.executable, '-u', _SANDBOX_WORKER],
+            input=line,
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            timeout=timeout,
+        )
+        out = result.stdout.strip()
+        if not out:
+            raise RuntimeError(f'No output. Stderr: {result.stderr.strip()[:200]}')
+        data = _SandboxWorker._decode(out)
+        data.pop('recycle', None)
+        return data
+
+    @staticmethod
+    def _decode(out: str) -> Dict[str, Any]:
         try:
-            data = json.loads(stdout)
-            if 'error' in data:
-                return 0, len(test_cases), [{'error': data['error']}]
-            return data.get('passed', 0), data.get('total', len(test_cases)), data.get('results', [])
-        except json.JSONDecodeError:
-            return 0, len(test_cases), [{'error': f'Invalid JSON: {stdout[:100]}'}]
-    
-    finally:
-        if tf:
+            return jsonio.loads(out)
+        except ValueError:
+            raise RuntimeError(f'Invalid JSON: {out[:100]}')
+
+    def close(self):
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        for stream in (proc.stdin, proc.stdout):
             try:
-                os.unlink(tf_name)
+                stream.close()
             except Exception:
                 pass
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class _SandboxPool:
+    """A fixed set of ``_SandboxWorker`` processes shared by concurrent jobs.
+
+    Workers start lazily, so only as many processes as the jobs actually
+    overlap on are spawned. ``run`` blocks, so call it from worker threads.
+    """
+
+    def __init__(self, size: int):
+        self._workers = [_SandboxWorker() for _ in range(max(1, size))]
+        self._idle: "queue.Queue[_SandboxWorker]" = queue.Queue()
+        for w in self._workers:
+            self._idle.put(w)
 
-def _run_coding_tests(client, model: str) -> Dict[str, Any]:
+    def run(self, code_src: str, test_cases: List[Tuple], timeout: int = 5) -> Tuple[int, int, List[Dict]]:
+        worker = self._idle.get()
+        try:
+            return _run_code_safely(code_src, test_cases, timeout, worker=worker)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        for w in self._workers:
+            w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+FORBIDDEN_MODULES = frozenset({"subprocess", "socket", "requests", "os", "importlib", "builtins"})
+FORBIDDEN_CALLS = frozenset({"eval", "exec", "__import__", "open"})
+# names that may not even be referenced, since a reference can be called
+# later (``f = eval``) or used to reach the others (``__builtins__[...]``)
+FORBIDDEN_NAMES = FORBIDDEN_CALLS | {"__builtins__"}
+# string constants that name any of the above, e.g. the argument of
+# importlib.import_module('subprocess') or __builtins__['__import__']
+_FORBIDDEN_STR_RE = re.compile(
+    r'\b(?:%s)\b|__import__|__builtins__|\b(?:%s)\s*\(' % (
+        '|'.join(sorted(FORBIDDEN_MODULES)),
+        '|'.join(sorted(FORBIDDEN_CALLS - {"__import__"})),
+    )
+)
+
+
+def _find_forbidden(tree: ast.AST) -> Optional[str]:
+    """Return the first forbidden import, name or string in ``tree``, or None."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split('.')[0] in FORBIDDEN_MODULES:
+                    return f'import {alias.name}'
+        elif isinstance(node, ast.ImportFrom):
+            if node.module and node.module.split('.')[0] in FORBIDDEN_MODULES:
+                return f'from {node.module} import'
+        elif isinstance(node, ast.Name):
+            if node.id in FORBIDDEN_NAMES:
+                return node.id
+        elif isinstance(node, ast.Attribute):
+            if node.attr in FORBIDDEN_NAMES:
+                return f'.{node.attr}'
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            # e.g. getattr(obj, 'exec')
+            if node.value.strip() in FORBIDDEN_NAMES:
+                return repr(node.value.strip())
+            m = _FORBIDDEN_STR_RE.search(node.value)
+            if m:
+                return repr(m.group(0))
+    return None
+
+
+def _run_code_safely(code_src: str, test_cases: List[Tuple], timeout: int = 5, worker: Optional[_SandboxWorker] = None) -> Tuple[int, int, List[Dict]]:
+    """Execute code in sandbox and run test cases. Returns (passed, total, details).
+
+    Pass a ``worker`` to reuse one sandbox process across calls; otherwise a
+    worker is started for this call only.
+    """
+    if not code_src:
+        return 0, len(test_cases), [{'error': 'No code extracted from response'}]
+    
+    # Security check
+    try:
+        forbidden = _find_forbidden(ast.parse(code_src))
+    except (SyntaxError, ValueError) as e:
+        return 0, len(test_cases), [{'error': f'{type(e).__name__}: {e}'}]
+    if forbidden:
+        return 0, len(test_cases), [{'error': f'Forbidden pattern: {forbidden}'}]
+    
+    if worker is None:
+        with _SandboxWorker() as w:
+            return _run_code_safely(code_src, test_cases, timeout, worker=w)
+    
+    try:
+        data = worker.run(code_src, test_cases, timeout)
+    except subprocess.TimeoutExpired:
+        return 0, len(test_cases), [{'error': f'Execution timeout ({timeout}s)'}]
+    except RuntimeError as e:
+        return 0, len(test_cases), [{'error': str(e)}]
+    
+    if 'error' in data:
+        return 0, len(test_cases), [{'error': data['error']}]
+    return data.get('passed', 0), data.get('total', len(test_cases)), data.get('results', [])
+
+
+async def _run_coding_tests(client, model: str, cache=None, sem: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
     """Run all coding tests and return detailed results."""
     results = []
-    total_points = 0
     earned_points = 0
-    difficulty_scores = {"easy": {"earned": 0, "total": 0},
-                         "medium": {"earned": 0, "total": 0},
-                         "hard": {"earned": 0, "total": 0}}
+    difficulty_earned = Counter()
     
-    for test in CODING_TESTS:
-        total_points += test["points"]
-        difficulty_scores[test["difficulty"]]["total"] += test["points"]
-        
-        latency, response, error = _chat_with_model(client, model, test["prompt"])
-        
+    # each test goes to the sandbox as soon as its own answer arrives, so
+    # sandbox time overlaps with the model still answering the others
+    async def solve_and_evaluate(test):
+        latency, response, error = await _achat_with_model(client, model, test["prompt"], cache=cache, sem=sem)
+        if error:
+            return (latency, response, error), None, None
+        code = _extract_code(response)
+        # the sandbox blocks on a subprocess; keep it off the event loop
+        outcome = await asyncio.to_thread(pool.run, code, test["test_cases"])
+        return (latency, response, error), code, outcome
+    
+    with _SandboxPool(min(len(CODING_TESTS), os.cpu_count() or 1)) as pool:
+        evaluated = await asyncio.gather(*(solve_and_evaluate(test) for test in CODING_TESTS))
+    
+    for test, ((latency, response, error), code, outcome) in zip(CODING_TESTS, evaluated):
         if error:
             results.append({
                 "name": test["name"],
@@ -412,18 +774,17 @@ def _run_coding_tests(client, model: str) -> Dict[str, Any]:
             })
             continue
         
-        code = _extract_code(response)
-        passed, total, test_details = _run_code_safely(code, test["test_cases"])
+        passed, total, test_details = outcome
         
         # Calculate points based on test pass rate
         if total > 0:
             points_earned = int((passed / total) * test["points"])
         else:
             points_earned = 0
-        
+    
         earned_points += points_earned
-        difficulty_scores[test["difficulty"]]["earned"] += points_earned
-        
+        difficulty_earned[test["difficulty"]] += points_earned
+    
         results.append({
             "name": test["name"],
             "difficulty": test["difficulty"],
@@ -432,25 +793,20 @@ def _run_coding_tests(client, model: str) -> Dict[str, Any]:
             "passed_tests": passed,
             "total_tests": total,
             "latency_s": round(latency, 3),
-            "code": code[:500] if code else None,
-            "raw_response": response[:300] if response else None,
-            "test_results": test_details[:5]  # Limit to first 5 for display
+            "code": code if code else None,
+            "raw_response": response if response else None,
+            "test_results": test_details
         })
     
     # Calculate scores
-    overall_score = round((earned_points / total_points) * 100, 1) if total_points > 0 else 0
+    overall_score = round((earned_points / _CODING_TOTAL) * 100, 1) if _CODING_TOTAL > 0 else 0
     
-    difficulty_percentages = {}
-    for diff, scores in difficulty_scores.items():
-        if scores["total"] > 0:
-            difficulty_percentages[diff] = round((scores["earned"] / scores["total"]) * 100, 1)
-        else:
-            difficulty_percentages[diff] = 0
+    difficulty_percentages = {diff: round((difficulty_earned[diff] / total) * 100, 1) for diff, total in _CODING_DIFF_TOTALS.items()}
     
     return {
         "score": overall_score,
         "earned_points": earned_points,
-        "total_points": total_points,
+        "total_points": _CODING_TOTAL,
         "difficulty_scores": difficulty_percentages,
         "tests": results
     }
@@ -458,59 +814,164 @@ def _run_coding_tests(client, model: str) -> Dict[str, Any]:
 
 # ==================== MAIN TEST FUNCTION ====================
 
-def test_model(client, model: str, repeat: int = 1) -> Dict[str, Any]:
+# how long Ollama keeps a model loaded after the warm-up request
+_KEEP_ALIVE = "10m"
+
+# default clients for callers that don't pass one, so repeated calls reuse
+# their connection pool; an AsyncClient is bound to the loop it was first
+# used on, so those are kept per loop
+_CLIENT = None
+_ACLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+
+def _get_client():
+    global _CLIENT
+    if _CLIENT is None:
+        from ollama import Client
+        _CLIENT = Client()
+    return _CLIENT
+
+
+def _get_aclient():
+    loop = asyncio.get_running_loop()
+    aclient = _ACLIENTS.get(loop)
+    if aclient is None:
+        from ollama import AsyncClient
+        aclient = _ACLIENTS[loop] = AsyncClient()
+    return aclient
+
+
+async def _warm_up(client, model: str) -> None:
+    """Load ``model`` before the timed prompts so none of them pays for it."""
+    try:
+        if inspect.iscoroutinefunction(client.generate):
+            await client.generate(model=model, prompt="", keep_alive=_KEEP_ALIVE)
+        else:
+            await asyncio.to_thread(client.generate, model=model, prompt="", keep_alive=_KEEP_ALIVE)
+    except Exception:
+        # best effort; the first prompt will load the model instead
+        pass
+
+
+def _trunc(s: Optional[str], n: int) -> Optional[str]:
+    return s if s is None or len(s) <= n else s[:n]
+
+
+@dataclass
+class _Pass:
+    """The report line for one test, formatted the first time it is needed.
+
+    Serializers should turn it into a string (e.g. ``default=str``).
+    """
+    test: Dict[str, Any]
+    kind: str  # "smartness" or "coding"
+
+    @functools.cached_property
+    def text(self) -> str:
+        t = self.test
+        if self.kind == "smartness":
+            return f"[{t['category'].upper()}] {t['name']}: {'✓ PASS' if t['passed'] else '✗ FAIL'} ({t['points']}pts) - {_trunc(str(t.get('response', '')), 100)}"
+        status = f"✓ {t['passed_tests']}/{t['total_tests']}" if t.get('passed_tests', 0) > 0 else f"✗ {t['passed_tests']}/{t['total_tests']}"
+        text = f"[{t['difficulty'].upper()}] {t['name']}: {status} ({t['earned']}/{t['points']}pts)"
+        if t.get('error'):
+            text += f" - Error: {t['error']}"
+        elif t.get('code'):
+            text += f"\nCode: {_trunc(t['code'], 200)}..."
+        return text
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def _prepare_for_display(smartness_results: Dict[str, Any], coding_results: Dict[str, Any]) -> None:
+    """Trim the per-test fields of both result sets in place for the report."""
+    for t in smartness_results.get("tests", []):
+        if not t.get("error"):
+            t["response"] = _trunc(t["response"], 500)
+    for t in coding_results.get("tests", []):
+        if "code" in t:
+            t["code"] = _trunc(t["code"], 500)
+        if "raw_response" in t:
+            t["raw_response"] = _trunc(t["raw_response"], 300)
+        # Limit to first 5 for display
+        t["test_results"] = t["test_results"][:5]
+
+def test_model(client, model: str, repeat: int = 1, cache=None, max_concurrency: Optional[int] = None, batch_smartness: bool = False, use_cache: bool = False, early_exit: bool = False, warm_up: bool = True) -> Dict[str, Any]:
     """Run comprehensive tests against a model.
     
     Tests include:
     - Smartness: Math, logic, reasoning, and knowledge tests
     - Coding: Easy, medium, and hard programming challenges
     
+    Prompts are sent concurrently, at most ``max_concurrency`` at a time
+    (default: the ``OLLAMA_NUM_PARALLEL`` environment variable, else 1, i.e.
+    one after another); only raise it to what the Ollama server is set to
+    answer in parallel, or server-side queueing is counted as latency.
+    ``cache`` is an optional response cache consulted before each prompt
+    (see ``_achat_with_model``). ``batch_smartness`` asks all smartness
+    questions in one prompt (see ``_run_smartness_batch``). ``use_cache``
+    without an explicit ``cache`` reuses answers stored on disk under
+    ``~/.cache/ollama_iq`` from earlier calls with the same model and prompt.
+    ``early_exit`` streams smartness answers and stops reading once they
+    are known to pass, so their latency is time to the answer.
+    With ``warm_up`` the model is loaded (and kept loaded for
+    ``_KEEP_ALIVE``) before any prompt is timed. ``client`` may be None to
+    use a shared default client for the local Ollama server.
+    
     Returns detailed results with scores and breakdowns.
     """
+    if client is None:
+        client = _get_client()
+    return asyncio.run(atest_model(client, model, repeat, cache=cache, max_concurrency=max_concurrency, batch_smartness=batch_smartness, use_cache=use_cache, early_exit=early_exit, warm_up=warm_up))
+
+
+async def atest_model(client, model: str, repeat: int = 1, cache=None, max_concurrency: Optional[int] = None, batch_smartness: bool = False, use_cache: bool = False, early_exit: bool = False, warm_up: bool = True) -> Dict[str, Any]:
+    """Async version of ``test_model`` for callers already running a loop."""
+    if client is None:
+        client = _get_aclient()
+    if use_cache and cache is None:
+        cache = _DiskCache()
+    if warm_up:
+        await _warm_up(client, model)
     all_latencies = []
     
-    # Run smartness tests
-    smartness_results = _run_smartness_tests(client, model)
+    limit = max_concurrency or _default_concurrency()
+    sem = asyncio.Semaphore(max(1, min(limit, len(SMARTNESS_TESTS) + len(CODING_TESTS))))
+    
+    # Run smartness and coding tests concurrently
+    smartness_results, coding_results = await asyncio.gather(
+        _run_smartness_tests(client, model, cache=cache, sem=sem, batch=batch_smartness, early_exit=early_exit),
+        _run_coding_tests(client, model, cache=cache, sem=sem),
+    )
     for test in smartness_results.get("tests", []):
         if test.get("latency_s"):
             all_latencies.append(test["latency_s"])
     
-    # Run coding tests
-    coding_results = _run_coding_tests(client, model)
     for test in coding_results.get("tests", []):
         if test.get("latency_s"):
             all_latencies.append(test["latency_s"])
     
     # Calculate latency stats
     if all_latencies:
+        # one sort gives the median and both extremes
+        all_latencies.sort()
+        n = len(all_latencies)
+        mid = n // 2
+        median = all_latencies[mid] if n % 2 else (all_latencies[mid - 1] + all_latencies[mid]) / 2
         latency_stats = {
-            "mean": round(statistics.mean(all_latencies), 4),
-            "median": round(statistics.median(all_latencies), 4),
-            "min": round(min(all_latencies), 4),
-            "max": round(max(all_latencies), 4),
+            "mean": round(math.fsum(all_latencies) / n, 4),
+            "median": round(median, 4),
+            "min": round(all_latencies[0], 4),
+            "max": round(all_latencies[-1], 4),
         }
     else:
         latency_stats = {"mean": None, "median": None, "min": None, "max": None}
     
-    # Build test passes for UI compatibility
-    smartness_passes = []
-    for t in smartness_results.get("tests", []):
-        smartness_passes.append({
-            "latency_s": t.get("latency_s", 0),
-            "response": f"[{t['category'].upper()}] {t['name']}: {'✓ PASS' if t['passed'] else '✗ FAIL'} ({t['points']}pts) - {str(t.get('response', ''))[:100]}"
-        })
+    _prepare_for_display(smartness_results, coding_results)
     
-    coding_passes = []
-    for t in coding_results.get("tests", []):
-        status = f"✓ {t['passed_tests']}/{t['total_tests']}" if t.get('passed_tests', 0) > 0 else f"✗ {t['passed_tests']}/{t['total_tests']}"
-        coding_passes.append({
-            "latency_s": t.get("latency_s", 0),
-            "response": f"[{t['difficulty'].upper()}] {t['name']}: {status} ({t['earned']}/{t['points']}pts)"
-        })
-        if t.get('error'):
-            coding_passes[-1]['response'] += f" - Error: {t['error']}"
-        elif t.get('code'):
-            coding_passes[-1]['response'] += f"\nCode: {t['code'][:200]}..."
+    # Build test passes for UI compatibility
+    smartness_passes = [{"latency_s": t.get("latency_s", 0), "response": _Pass(t, "smartness")} for t in smartness_results.get("tests", [])]
+    coding_passes = [{"latency_s": t.get("latency_s", 0), "response": _Pass(t, "coding")} for t in coding_results.get("tests", [])]
     
     return {
         "model": model,
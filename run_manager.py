@@ -1,62 +1,144 @@
 # SPDX-License-Identifier: GPL-3.0-only
-import asyncio
-import uuid
-from typing import Any, Dict
-
+import threading
+import secrets
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+# Run state is a plain dict updated from background threads. Each run is
+# only written by the thread executing it, and single item assignments and
+# deque appends are atomic, so updates take no lock; RUNS_LOCK only guards
+# inserting new runs. The async functions below are thin wrappers kept for
+# async callers.
 RUNS: Dict[str, Dict[str, Any]] = {}
-RUNS_LOCK = asyncio.Lock()
+RUNS_LOCK = threading.RLock()
+# notified on every run update so listeners (the /run_events stream) can
+# block until something changes instead of polling
+RUNS_CHANGED = threading.Condition(RUNS_LOCK)
+_VERSIONS: Dict[str, int] = {}
+# threads blocked in wait_for_change_sync; writers only take the lock to
+# notify when someone is listening
+_waiters = 0
+
+
+def _touch(run_id: str):
+    _VERSIONS[run_id] = _VERSIONS.get(run_id, 0) + 1
+    # a waiter registers before checking the version, so if it isn't
+    # counted yet it will see the bump without being notified
+    if _waiters:
+        with RUNS_CHANGED:
+            RUNS_CHANGED.notify_all()
 
 
 def create_run(metadata: Dict[str, Any]) -> str:
     """Create a new run and return run_id."""
-    run_id = uuid.uuid4().hex
-    RUNS[run_id] = {
-        "id": run_id,
-        "status": "pending",
-        "messages": [],
-        "progress": 0,
-        "metadata": metadata,
-        "result": None,
-    }
+    run_id = secrets.token_hex(16)
+    with RUNS_LOCK:
+        RUNS[run_id] = {
+            "id": run_id,
+            "status": "pending",
+            "messages": deque(),
+            "progress": 0,
+            "metadata": metadata,
+            "result": None,
+        }
+        _touch(run_id)
     return run_id
 
 
+def set_running_sync(run_id: str):
+    r = RUNS.get(run_id)
+    if r is not None:
+        r["status"] = "running"
+        _touch(run_id)
+
+
+def append_message_sync(run_id: str, msg: str):
+    r = RUNS.get(run_id)
+    if r is not None:
+        r["messages"].append(msg)
+        _touch(run_id)
+
+
+def set_progress_sync(run_id: str, pct: float):
+    r = RUNS.get(run_id)
+    if r is not None:
+        r["progress"] = pct
+        _touch(run_id)
+
+
+def set_result_sync(run_id: str, result: Dict[str, Any]):
+    r = RUNS.get(run_id)
+    if r is not None:
+        # status last, so a reader that sees "done" also sees the result
+        r["result"] = result
+        r["progress"] = 100
+        r["status"] = "done"
+        _touch(run_id)
+
+
+def set_error_sync(run_id: str, err_msg: str):
+    r = RUNS.get(run_id)
+    if r is not None:
+        r["messages"].append(err_msg)
+        r["status"] = "error"
+        _touch(run_id)
+
+
+def get_run_sync(run_id: str) -> Optional[Dict[str, Any]]:
+    """Return a snapshot of the run that is safe to serialize while it progresses."""
+    r = RUNS.get(run_id)
+    if r is None:
+        return None
+    return dict(r, messages=list(r["messages"]))
+
+
+def wait_for_change_sync(run_id: str, version: int, timeout: Optional[float] = None) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """Block until the run changes past ``version`` (or ``timeout`` expires).
+
+    Returns ``(current_version, snapshot)``, or None for an unknown run.
+    Pass version 0 to get the current state immediately.
+    """
+    global _waiters
+    with RUNS_CHANGED:
+        _waiters += 1
+        try:
+            RUNS_CHANGED.wait_for(lambda: run_id not in RUNS or _VERSIONS.get(run_id, 0) != version, timeout)
+        finally:
+            _waiters -= 1
+        current = _VERSIONS.get(run_id, 0)
+        snap = get_run_sync(run_id)
+        if snap is None:
+            return None
+        return current, snap
+
+
+def list_runs_sync() -> List[Dict[str, Any]]:
+    return list(RUNS.values())
+
+
 async def set_running(run_id: str):
-    async with RUNS_LOCK:
-        if run_id in RUNS:
-            RUNS[run_id]["status"] = "running"
+    set_running_sync(run_id)
 
 
 async def append_message(run_id: str, msg: str):
-    async with RUNS_LOCK:
-        if run_id in RUNS:
-            RUNS[run_id]["messages"].append(msg)
+    append_message_sync(run_id, msg)
 
 
 async def set_progress(run_id: str, pct: float):
-    async with RUNS_LOCK:
-        if run_id in RUNS:
-            RUNS[run_id]["progress"] = pct
+    set_progress_sync(run_id, pct)
 
 
 async def set_result(run_id: str, result: Dict[str, Any]):
-    async with RUNS_LOCK:
-        if run_id in RUNS:
-            RUNS[run_id]["status"] = "done"
-            RUNS[run_id]["result"] = result
-            RUNS[run_id]["progress"] = 100
+    set_result_sync(run_id, result)
 
 
 async def set_error(run_id: str, err_msg: str):
-    async with RUNS_LOCK:
-        if run_id in RUNS:
-            RUNS[run_id]["status"] = "error"
-            RUNS[run_id]["messages"].append(err_msg)
+    set_error_sync(run_id, err_msg)
 
 
 async def get_run(run_id: str):
-    return RUNS.get(run_id)
+    return get_run_sync(run_id)
 
 
 async def list_runs():
-    return list(RUNS.values())
+    return list_runs_sync()
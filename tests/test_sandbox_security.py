@@ -0,0 +1,55 @@
+# SPDX-License-Identifier: GPL-3.0-only
+"""Regression cases for the sandbox's forbidden-code check.
+
+Run with ``python -m unittest discover tests`` from the project root.
+"""
+import ast
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_etch_tester import _find_forbidden, _run_code_safely  # noqa: E402
+
+
+BLOCKED = [
+    "import importlib; importlib.import_module('subprocess').check_output(['id'])",
+    "__builtins__['__import__']('subprocess').check_output(['id'])",
+    "from importlib import import_module",
+    "import builtins",
+    "globals()['__builtins__']",
+    "getattr(obj, 'exec')",
+    "f = eval",
+    "x.open('/etc/passwd')",
+    "import os.path",
+    "from subprocess import run",
+    "s = 'os.system'",
+]
+
+ALLOWED = [
+    "def solve(nums):\n    return sum(nums)",
+    'def solve(text):\n    """Reverse the words."""\n    return " ".join(reversed(text.split()))',
+    "# subprocess is not used here\ndef solve(x):\n    return x",
+]
+
+
+class ForbiddenCodeTests(unittest.TestCase):
+    def test_blocked(self):
+        for src in BLOCKED:
+            with self.subTest(src=src):
+                self.assertIsNotNone(_find_forbidden(ast.parse(src)))
+
+    def test_allowed(self):
+        for src in ALLOWED:
+            with self.subTest(src=src):
+                self.assertIsNone(_find_forbidden(ast.parse(src)))
+
+    def test_bypass_is_not_executed(self):
+        passed, total, details = _run_code_safely(BLOCKED[0], [(1, 1)])
+        self.assertEqual((passed, total), (0, 1))
+        self.assertTrue(details[0]['error'].startswith('Forbidden pattern'))
+
+
+if __name__ == '__main__':
+    unittest.main()
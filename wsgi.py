@@ -0,0 +1,15 @@
+# SPDX-License-Identifier: GPL-3.0-only
+"""WSGI entry point for production servers, e.g.:
+
+    gunicorn -k gthread -w 1 --threads 8 -b 0.0.0.0:9912 wsgi:app
+
+Keep a single worker process: live run progress is held in memory by
+run_manager, so every request for a run must reach the process that
+started it. Use --threads to serve concurrent requests; every browser tab
+watching a run holds one thread through its /run_events stream (streams
+end every 30 s and reconnect), so size it above the number of tabs that
+watch runs at once.
+"""
+from app import app
+
+__all__ = ["app"]